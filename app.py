@@ -1,27 +1,51 @@
 import logging
+import threading
 from flask import Flask
-from flask_cors import CORS
+from flask.json.provider import DefaultJSONProvider
 from config import Config
+from db.chroma_db import get_player_collection
 from routes.chatbot_routes import chatbot_bp
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Set up logging
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
 
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that serializes and parses with orjson"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
 
-    # Initialize CORS
-    CORS(app)
+    # jsonify and request.get_json use orjson when it is installed
+    if orjson is not None:
+        app.json = ORJSONProvider(app)
 
     # Register blueprints
     app.register_blueprint(chatbot_bp, url_prefix="/chatbot")
 
+    # Load the player collection in the background so the first chat request doesn't pay for it
+    if app.config["WARM_COLLECTION_ON_STARTUP"]:
+        threading.Thread(target=get_player_collection, name="collection-warmup", daemon=True).start()
+
     return app
 
 
 if __name__ == "__main__":
     app = create_app()
-    app.run(debug=True, host="0.0.0.0", port=5000)
\ No newline at end of file
+    # Development server only; see README for running under gunicorn in production
+    app.run(debug=app.config["DEBUG"], host="0.0.0.0", port=5000)
\ No newline at end of file
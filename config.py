@@ -6,12 +6,56 @@ load_dotenv()
 
 
 class Config:
+    # Flask debug mode (reloader + debugger); off unless FLASK_DEBUG is set
+    DEBUG = os.getenv("FLASK_DEBUG", "0").lower() in ("1", "true", "yes")
+
     # API Keys
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+    # Gemini client transport: "grpc" keeps one multiplexed HTTP/2 channel per process, "rest" uses HTTPS
+    GEMINI_TRANSPORT = os.getenv("GEMINI_TRANSPORT", "grpc")
+    # Gemini response cache size and entry lifetime in seconds
+    GEMINI_CACHE_SIZE = int(os.getenv("GEMINI_CACHE_SIZE", 1024))
+    GEMINI_CACHE_TTL = int(os.getenv("GEMINI_CACHE_TTL", 300))
+    # Gemini calls allowed in flight at once per process
+    GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", 16))
+    # Chatbot query response cache size and entry lifetime in seconds
+    RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 1024))
+    RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", 300))
+
+    # CORS settings; comma-separated allowed origins
+    CORS_ORIGINS = os.getenv("CORS_ORIGINS", "*").split(",")
+    CORS_MAX_AGE = int(os.getenv("CORS_MAX_AGE", 86400))
 
     # Paths
     DATASET_PATH = os.getenv("DATASET_PATH", "data/players.csv")
+    # Parquet copy of the dataset that player updates are saved to; empty means DATASET_PATH with a .parquet extension
+    DATASET_PATH_PARQUET = os.getenv("DATASET_PATH_PARQUET", "")
+    # Seconds a worker waits for the player dataset lock before failing the update
+    DATASET_LOCK_TIMEOUT = float(os.getenv("DATASET_LOCK_TIMEOUT", 30))
 
     # ChromaDB settings
     CHROMA_PERSIST_DIRECTORY = os.getenv("CHROMA_PERSIST_DIRECTORY", "chroma_db")
-    COLLECTION_NAME = os.getenv("COLLECTION_NAME", "cricket_players")
\ No newline at end of file
+    # Chroma server to use instead of the local persistent directory; required to run more than one worker process
+    CHROMA_HOST = os.getenv("CHROMA_HOST", "")
+    CHROMA_PORT = int(os.getenv("CHROMA_PORT", 8000))
+    COLLECTION_NAME = os.getenv("COLLECTION_NAME", "cricket_players")
+    # Build the player collection on a background thread when the app starts
+    WARM_COLLECTION_ON_STARTUP = os.getenv("WARM_COLLECTION_ON_STARTUP", "1").lower() in ("1", "true", "yes")
+    # Optional sentence-transformers model (e.g. all-MiniLM-L6-v2); empty uses Chroma's default ONNX model
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "")
+    EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "cpu")
+    # Documents embedded and upserted per ingest batch; must stay below Chroma's max batch size
+    CHROMA_BATCH_SIZE = int(os.getenv("CHROMA_BATCH_SIZE", 256))
+    # Ingest batches processed concurrently
+    INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", os.cpu_count() or 1))
+    # HNSW index parameters for newly created collections
+    HNSW_SPACE = os.getenv("HNSW_SPACE", "cosine")
+    HNSW_CONSTRUCTION_EF = int(os.getenv("HNSW_CONSTRUCTION_EF", 200))
+    HNSW_SEARCH_EF = int(os.getenv("HNSW_SEARCH_EF", 100))
+    HNSW_M = int(os.getenv("HNSW_M", 16))
+    HNSW_NUM_THREADS = int(os.getenv("HNSW_NUM_THREADS", os.cpu_count() or 1))
+    # Concurrent vector searches are merged into one query for up to this many queries / milliseconds
+    QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", 32))
+    QUERY_BATCH_WAIT_MS = int(os.getenv("QUERY_BATCH_WAIT_MS", 50))
+    # Query embeddings kept in memory, keyed by the normalized query text
+    QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 10000))
\ No newline at end of file
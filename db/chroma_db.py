@@ -1,157 +1,590 @@
 import logging
 import os
+import re
+import tempfile
 import pandas as pd
 import chromadb
 import numpy as np
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from chromadb.utils import embedding_functions
+from collections import OrderedDict
 from functools import lru_cache
 from config import Config
 
+try:
+    import fcntl
+except ImportError:
+    # Windows locks files with msvcrt instead
+    fcntl = None
+    import msvcrt
+
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# Player CSV columns grouped by the type they are coerced to on ingest
+TEXT_COLUMNS = ['Name', 'University', 'Category']
+INT_COLUMNS = ['Total Runs', 'Balls Faced', 'Innings Played', 'Wickets', 'Runs Conceded', 'Base Price']
+FLOAT_COLUMNS = ['Overs Bowled']
+PLAYER_CSV_COLUMNS = TEXT_COLUMNS + INT_COLUMNS + FLOAT_COLUMNS
+# Stored dtypes: nullable ints sized to the stat, categories for the few distinct categories.
+# Overs stay float64 so values such as 3.2 round-trip exactly into the documents.
+PLAYER_CSV_DTYPES = {
+    'Name': 'string',
+    'University': 'string',
+    'Category': 'category',
+    'Total Runs': 'Int32',
+    'Balls Faced': 'Int32',
+    'Innings Played': 'Int16',
+    'Wickets': 'Int16',
+    'Runs Conceded': 'Int32',
+    'Base Price': 'Int64',
+    'Overs Bowled': 'Float64'
+}
 
-def classify_player_role(player_data):
-    """Classify a player's role based on their stats"""
-    runs = int(player_data.get('Total Runs', 0)) if pd.notna(player_data.get('Total Runs', 0)) else 0
-    wickets = int(player_data.get('Wickets', 0)) if pd.notna(player_data.get('Wickets', 0)) else 0
+# Prepared frame column -> ChromaDB metadata key
+PLAYER_FIELDS = {
+    'Name': 'name',
+    'University': 'university',
+    'Category': 'category',
+    'Role': 'role',
+    'Total Runs': 'total_runs',
+    'Balls Faced': 'balls_faced',
+    'Innings Played': 'innings_played',
+    'Wickets': 'wickets',
+    'Overs Bowled': 'overs_bowled',
+    'Runs Conceded': 'runs_conceded',
+    'Base Price': 'base_price'
+}
 
-    if wickets > 5 and runs < 50:
-        return 'Bowler'
-    elif runs > 100 and wickets < 3:
-        return 'Batsman'
-    else:
-        return 'All-Rounder'
+# Any of these keywords anywhere in a query marks it as cricket related
+CRICKET_KEYWORDS = [
+    'cricket', 'player', 'batsman', 'bowler', 'all-rounder', 'allrounder',
+    'team', 'runs', 'wickets', 'innings', 'stats', 'statistics', 'batting',
+    'bowling', 'score', 'match', 'tournament', 'performance', 'best'
+]
+CRICKET_KEYWORDS_RE = re.compile('|'.join(map(re.escape, CRICKET_KEYWORDS)), re.IGNORECASE)
+
+# HNSW index parameters applied when the collection is first created. The brute-force
+# buffer matches the ingest batch so each upsert batch is inserted into the graph at once.
+HNSW_METADATA = {
+    'hnsw:space': Config.HNSW_SPACE,
+    'hnsw:construction_ef': Config.HNSW_CONSTRUCTION_EF,
+    'hnsw:search_ef': Config.HNSW_SEARCH_EF,
+    'hnsw:M': Config.HNSW_M,
+    'hnsw:num_threads': Config.HNSW_NUM_THREADS,
+    'hnsw:batch_size': Config.CHROMA_BATCH_SIZE,
+    'hnsw:sync_threshold': max(Config.CHROMA_BATCH_SIZE, 1000)
+}
+
+# Process-wide embedding function, loaded once and shared by every collection rebuild
+_embedding_function = None
+_embedding_function_lock = threading.Lock()
+
+# Cross-process lock on the player dataset: an OS lock on a lock file, held by one thread
+# of one process at a time and re-entrant within that thread
+_dataset_lock = threading.RLock()
+_dataset_lock_fd = None
+
+# Normalized query -> embedding, least recently stored first, capped at QUERY_EMBEDDING_CACHE_SIZE
+_query_embeddings = OrderedDict()
+_query_embeddings_lock = threading.Lock()
 
+# Process-wide player collection, built once and replaced on refresh. The version is
+# bumped on every (re)build so caches derived from the collection know to rebuild. The
+# dataset signature it was built from lets every worker process notice an update that
+# another worker saved and refresh its own collection, index and caches.
+_collection = None
+_collection_version = 0
+_collection_signature = None
+_collection_lock = threading.Lock()
 
+# (label, prepared frame column) pairs rendered into each player's embedding document
+DOCUMENT_FIELDS = [
+    ('Player', 'Name'),
+    ('University', 'University'),
+    ('Category', 'Category'),
+    ('Role', 'Role'),
+    ('Total Runs', 'Total Runs'),
+    ('Balls Faced', 'Balls Faced'),
+    ('Innings Played', 'Innings Played'),
+    ('Wickets', 'Wickets'),
+    ('Overs Bowled', 'Overs Bowled'),
+    ('Runs Conceded', 'Runs Conceded'),
+    ('Base Price', 'Base Price')
+]
+
+
+def classify_player_roles(runs, wickets):
+    """Classify players' roles from arrays of their runs and wickets"""
+    runs = np.asarray(runs)
+    wickets = np.asarray(wickets)
+    return np.select(
+        [(wickets > 5) & (runs < 50), (runs > 100) & (wickets < 3)],
+        ['Bowler', 'Batsman'],
+        default='All-Rounder'
+    )
+
+
+@lru_cache(maxsize=4096)
 def validate_cricket_query(query):
     """Validate if a query is related to cricket"""
-    cricket_keywords = [
-        'cricket', 'player', 'batsman', 'bowler', 'all-rounder', 'allrounder',
-        'team', 'runs', 'wickets', 'innings', 'stats', 'statistics', 'batting',
-        'bowling', 'score', 'match', 'tournament', 'performance', 'best'
-    ]
+    return CRICKET_KEYWORDS_RE.search(query) is not None
+
+
+def _create_embedding_function():
+    """Create the configured embedding function, falling back to Chroma's default ONNX model"""
+    if Config.EMBEDDING_MODEL:
+        try:
+            return embedding_functions.SentenceTransformerEmbeddingFunction(
+                model_name=Config.EMBEDDING_MODEL,
+                device=Config.EMBEDDING_DEVICE,
+                normalize_embeddings=True
+            )
+        except Exception as e:
+            logger.warning(f"Could not load sentence-transformers model {Config.EMBEDDING_MODEL}, "
+                           f"using default embedding function: {str(e)}")
+    return embedding_functions.DefaultEmbeddingFunction()
+
+
+def get_embedding_function():
+    """Get the shared embedding function, creating it on first use"""
+    global _embedding_function
+    if _embedding_function is None:
+        with _embedding_function_lock:
+            if _embedding_function is None:
+                _embedding_function = _create_embedding_function()
+    return _embedding_function
+
+
+def normalize_query(query_text):
+    """Normalize a query for embedding cache lookups"""
+    query_text = query_text.strip()
+    # Chroma's default model is uncased, so case variants share one embedding; a configured
+    # sentence-transformers model may be cased, so its queries keep their case
+    return query_text if Config.EMBEDDING_MODEL else query_text.lower()
+
+
+def embed_queries(query_texts):
+    """Embed normalized queries, running the model once for all of those not already cached"""
+    with _query_embeddings_lock:
+        embeddings = [_query_embeddings.get(text) for text in query_texts]
+    misses = list(dict.fromkeys(text for text, embedding in zip(query_texts, embeddings) if embedding is None))
+    if not misses:
+        return embeddings
+
+    computed = {text: [float(value) for value in embedding]
+                for text, embedding in zip(misses, get_embedding_function()(misses))}
+    with _query_embeddings_lock:
+        for text, embedding in computed.items():
+            _query_embeddings[text] = embedding
+            _query_embeddings.move_to_end(text)
+        while len(_query_embeddings) > Config.QUERY_EMBEDDING_CACHE_SIZE:
+            _query_embeddings.popitem(last=False)
+    return [computed[text] if embedding is None else embedding for text, embedding in zip(query_texts, embeddings)]
+
+
+def read_player_csv(csv_file_path):
+    """Read only the player columns from the CSV with their dtypes declared up front"""
+    usecols = lambda column: column in PLAYER_CSV_DTYPES
+    try:
+        return pd.read_csv(csv_file_path, usecols=usecols, dtype=PLAYER_CSV_DTYPES, engine='c')
+    except (ValueError, TypeError) as e:
+        # Malformed numeric cells; parse untyped and let prepare_player_frame coerce them
+        logger.warning(f"Typed CSV parse failed, falling back to inference: {str(e)}")
+        return pd.read_csv(csv_file_path, usecols=usecols, engine='c')
+
+
+def write_file_atomically(path, write):
+    """Call write(tmp_path) and move the finished file over path, so readers never see a partial file"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def player_dataset_lock_path():
+    """Path of the lock file guarding the player dataset"""
+    return Config.DATASET_PATH + '.lock'
+
+
+def _lock_file(fd):
+    """Take an exclusive lock on an open file without blocking; False if another process holds it"""
+    try:
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock_file(fd):
+    """Release a lock taken by _lock_file"""
+    if fcntl:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def player_dataset_lock():
+    """Hold the player dataset lock so a read-modify-write is not interleaved with another worker's
+
+    The lock is an OS lock on the lock file, so the OS releases it if its holder dies; the file
+    itself is never removed, since that would let two processes lock different files.
+    """
+    global _dataset_lock_fd
+    with _dataset_lock:
+        if _dataset_lock_fd is not None:
+            # Already held by this thread
+            yield
+            return
+
+        fd = os.open(player_dataset_lock_path(), os.O_CREAT | os.O_RDWR)
+        try:
+            deadline = time.monotonic() + Config.DATASET_LOCK_TIMEOUT
+            while not _lock_file(fd):
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Timed out waiting for player dataset lock {player_dataset_lock_path()}")
+                time.sleep(0.05)
+            _dataset_lock_fd = fd
+            try:
+                yield
+            finally:
+                _dataset_lock_fd = None
+                _unlock_file(fd)
+        finally:
+            os.close(fd)
+
+
+def player_parquet_path():
+    """Path of the Parquet copy of the player dataset"""
+    return Config.DATASET_PATH_PARQUET or os.path.splitext(Config.DATASET_PATH)[0] + '.parquet'
+
+
+def player_dataset_exists():
+    """Whether the player dataset exists as CSV or Parquet"""
+    return os.path.exists(Config.DATASET_PATH) or os.path.exists(player_parquet_path())
 
-    query_lower = query.lower()
-    return any(keyword in query_lower for keyword in cricket_keywords)
 
+def player_dataset_signature():
+    """(path, mtime, size) of the CSV and the Parquet copy, mtime and size None for a missing file; changes whenever either is rewritten"""
+    signature = []
+    for path in (Config.DATASET_PATH, player_parquet_path()):
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((path, None, None))
+    return tuple(signature)
+
+
+def load_player_frame():
+    """Load the player dataset from its Parquet copy, reading the CSV only when there is no Parquet copy yet"""
+    csv_file_path = Config.DATASET_PATH
+    parquet_path = player_parquet_path()
+    # Player updates are saved only to the Parquet copy, so the CSV is never preferred over it,
+    # even when a checkout or deploy gives the CSV a newer mtime
+    if os.path.exists(parquet_path):
+        try:
+            return pd.read_parquet(parquet_path)
+        except Exception as e:
+            logger.warning(f"Could not read Parquet dataset {parquet_path}, reading the CSV instead: {str(e)}")
+            return read_player_csv(csv_file_path)
+
+    # First load; migrate the CSV seed into the Parquet copy that later loads and updates use.
+    # Under the lock, so a worker migrating cannot overwrite an update another worker just saved.
+    with player_dataset_lock():
+        if os.path.exists(parquet_path):
+            return load_player_frame()
+        df = read_player_csv(csv_file_path)
+        try:
+            write_file_atomically(parquet_path, lambda path: df.to_parquet(path, compression='zstd', index=False))
+        except Exception as e:
+            logger.warning(f"Could not write Parquet dataset {parquet_path}: {str(e)}")
+        return df
+
+
+def apply_player_dtypes(df):
+    """Cast the player columns to their stored dtypes, leaving any column that does not fit as it is"""
+    for column, dtype in PLAYER_CSV_DTYPES.items():
+        # Re-casting a column that already has its dtype is skipped; besides the wasted copy, it
+        # leaves a categorical column's codes read-only so the next in-place update fails
+        if column in df and df[column].dtype != dtype:
+            try:
+                df[column] = df[column].astype(dtype)
+            except (ValueError, TypeError) as e:
+                logger.warning(f"Keeping column {column} as {df[column].dtype}: {str(e)}")
+    return df
 
-# Helper function to safely convert values to int or float
-def safe_convert(value, convert_type=int, default=0):
-    """Safely convert a value to int or float, handling NaN and None cases"""
-    if pd.isna(value) or value is None:
+
+def save_player_frame(df):
+    """Save the player dataset as Parquet, falling back to the CSV when Parquet cannot be written; returns the typed frame"""
+    df = apply_player_dtypes(df)
+    parquet_path = player_parquet_path()
+    try:
+        write_file_atomically(parquet_path, lambda path: df.to_parquet(path, compression='zstd', index=False))
+        return df
+    except Exception as e:
+        logger.warning(f"Could not write Parquet dataset {parquet_path}, saving CSV instead: {str(e)}")
+    write_file_atomically(Config.DATASET_PATH, lambda path: df.to_csv(path, index=False))
+    # The Parquet copy is read in preference to the CSV; drop it so the CSV just saved is not shadowed
+    if os.path.exists(parquet_path):
+        os.remove(parquet_path)
+    return df
+
+
+def prepare_player_frame(df):
+    """Coerce raw player CSV columns to typed columns and classify every role at once"""
+    df = df.reindex(columns=list(PLAYER_CSV_COLUMNS))
+
+    for column in INT_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors='coerce').fillna(0).astype(np.int64)
+    for column in FLOAT_COLUMNS:
+        df[column] = pd.to_numeric(df[column], errors='coerce').fillna(0).astype(np.float64)
+    for column in TEXT_COLUMNS:
+        df[column] = df[column].astype('string').fillna('').astype(str)
+
+    df['Role'] = classify_player_roles(df['Total Runs'].to_numpy(), df['Wickets'].to_numpy())
+    return df
+
+
+def build_player_documents(df):
+    """Render every player's embedding document with column-wise string concatenation"""
+    documents = pd.Series('', index=df.index, dtype=object)
+    for label, column in DOCUMENT_FIELDS:
+        documents = documents + f"{label}: " + df[column].astype(str) + '\n'
+    return documents.tolist()
+
+
+# Helpers to safely convert single values, treating None and NaN as the default
+def safe_int(value, default=0):
+    """Safely convert a value to int without going through pd.isna"""
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return default if value != value else int(value)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return default
+
+
+def safe_float(value, default=0.0):
+    """Safely convert a value to float without going through pd.isna"""
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        return default if value != value else float(value)
+    if value is None:
         return default
     try:
-        return convert_type(value)
+        return float(value)
     except (ValueError, TypeError):
         return default
 
 
-@lru_cache(maxsize=1)
+def _upsert_player_batch(collection, embedding_function, documents, metadatas, ids):
+    """Embed one slice of player documents and upsert it into the collection"""
+    collection.upsert(
+        documents=documents,
+        metadatas=metadatas,
+        embeddings=embedding_function(documents),
+        ids=ids
+    )
+
+
 def get_player_collection(force_refresh=False):
+    """Get the shared ChromaDB collection for cricket players, rebuilding it on force_refresh"""
+    global _collection, _collection_version, _collection_signature
+    if _collection is None or force_refresh or player_dataset_signature() != _collection_signature:
+        with _collection_lock:
+            if _collection is None or force_refresh or player_dataset_signature() != _collection_signature:
+                # A changed dataset signature means another process saved an update; reload from it
+                _collection = _build_player_collection(force_refresh or _collection is not None)
+                # Taken after the build, which writes the Parquet copy on a first load from the CSV
+                _collection_signature = player_dataset_signature()
+                _collection_version += 1
+    return _collection
+
+
+def get_collection_version():
+    """Get the version of the shared player collection, bumped on every rebuild
+
+    Refreshes the collection first when the player dataset changed since it was built,
+    so caches keyed by the version never outlive an update made by another process.
+    """
+    if _collection is not None and player_dataset_signature() != _collection_signature:
+        get_player_collection()
+    return _collection_version
+
+
+def _build_player_collection(force_refresh=False):
     """Get or create the ChromaDB collection for cricket players"""
     try:
         # Initialize client
         persist_directory = Config.CHROMA_PERSIST_DIRECTORY
         collection_name = Config.COLLECTION_NAME
 
-        # Create directory if it doesn't exist
-        if not os.path.exists(persist_directory):
-            os.makedirs(persist_directory)
+        if Config.CHROMA_HOST:
+            # A Chroma server holds one collection shared by every worker process
+            client = chromadb.HttpClient(host=Config.CHROMA_HOST, port=Config.CHROMA_PORT)
+        else:
+            # Create directory if it doesn't exist
+            if not os.path.exists(persist_directory):
+                os.makedirs(persist_directory)
 
-        # Create client
-        client = chromadb.PersistentClient(path=persist_directory)
+            # Local persistent mode keeps the index in this process, so it supports one worker process
+            client = chromadb.PersistentClient(path=persist_directory)
 
         # Get or create collection
-        embedding_function = embedding_functions.DefaultEmbeddingFunction()
-
-        # If force refresh, delete the collection if it exists
-        if force_refresh:
-            try:
-                client.delete_collection(name=collection_name)
-                logger.info(f"Deleted collection {collection_name} for refresh")
-            except Exception as e:
-                logger.warning(f"No collection to delete or error: {str(e)}")
+        embedding_function = get_embedding_function()
 
         # Create or get collection
         collection = client.get_or_create_collection(
             name=collection_name,
-            embedding_function=embedding_function
+            embedding_function=embedding_function,
+            metadata=HNSW_METADATA
         )
 
-        # Load player data from CSV
-        csv_file_path = Config.DATASET_PATH
-        if not os.path.exists(csv_file_path):
-            logger.warning(f"CSV file not found at {csv_file_path}")
+        # Already populated and no refresh requested; skip reading the CSV
+        if not force_refresh and collection.count() > 0:
             return collection
 
-        df = pd.read_csv(csv_file_path)
-
-        # Check if collection is empty or force refresh requested
-        if collection.count() == 0 or force_refresh:
-            # Clear collection if needed (already done if force_refresh was True)
-            if collection.count() > 0 and force_refresh:
-                collection.delete(where={})
-
-            # Prepare data for insertion
-            documents = []
-            metadatas = []
-            ids = []
-
-            for index, row in df.iterrows():
-                player_id = f"player_{index}"
-
-                # Determine player role based on stats
-                player_role = classify_player_role(row)
-
-                # Create document text
-                document = f"""
-                Player: {row['Name']}
-                University: {row.get('University', '')}
-                Category: {row.get('Category', '')}
-                Role: {player_role}
-                Total Runs: {safe_convert(row.get('Total Runs', 0))}
-                Balls Faced: {safe_convert(row.get('Balls Faced', 0))}
-                Innings Played: {safe_convert(row.get('Innings Played', 0))}
-                Wickets: {safe_convert(row.get('Wickets', 0))}
-                Overs Bowled: {safe_convert(row.get('Overs Bowled', 0), float)}
-                Runs Conceded: {safe_convert(row.get('Runs Conceded', 0))}
-                Base Price: {safe_convert(row.get('Base Price', 0))}
-                """
-
-                # Create metadata with safe conversions
-                metadata = {
-                    'name': str(row['Name']),
-                    'university': str(row.get('University', '')),
-                    'category': str(row.get('Category', '')),
-                    'role': str(player_role),
-                    'total_runs': safe_convert(row.get('Total Runs', 0)),
-                    'balls_faced': safe_convert(row.get('Balls Faced', 0)),
-                    'innings_played': safe_convert(row.get('Innings Played', 0)),
-                    'wickets': safe_convert(row.get('Wickets', 0)),
-                    'overs_bowled': safe_convert(row.get('Overs Bowled', 0), float),
-                    'runs_conceded': safe_convert(row.get('Runs Conceded', 0)),
-                    'base_price': safe_convert(row.get('Base Price', 0))
-                }
-
-                documents.append(document)
-                metadatas.append(metadata)
-                ids.append(player_id)
-
-            # Add data to collection in batches
-            if documents:
-                batch_size = 100
-                for i in range(0, len(documents), batch_size):
-                    batch_end = min(i + batch_size, len(documents))
-                    collection.add(
-                        documents=documents[i:batch_end],
-                        metadatas=metadatas[i:batch_end],
-                        ids=ids[i:batch_end]
-                    )
-                logger.info(f"Added {len(documents)} players to ChromaDB collection")
+        # Load player data from the Parquet copy or the CSV
+        if not player_dataset_exists():
+            logger.warning(f"Player dataset not found at {Config.DATASET_PATH} or {player_parquet_path()}")
+            return collection
+
+        df = prepare_player_frame(load_player_frame())
+
+        # Prepare data for insertion, one column operation per field
+        metadatas = df[list(PLAYER_FIELDS)].rename(columns=PLAYER_FIELDS).to_dict(orient='records')
+        documents = build_player_documents(df)
+        ids = [f"player_{index}" for index in df.index]
+        all_ids = ids
+
+        # On refresh only players whose document changed are embedded again; the document renders
+        # every metadata field, so an unchanged document means unchanged metadata too
+        stored_documents = {}
+        if force_refresh:
+            stored = collection.get(include=['documents'])
+            stored_documents = dict(zip(stored['ids'], stored['documents']))
+            changed = [i for i, player_id in enumerate(ids) if stored_documents.get(player_id) != documents[i]]
+            if len(changed) < len(ids):
+                logger.info(f"Skipping {len(ids) - len(changed)} unchanged players on refresh")
+                documents = [documents[i] for i in changed]
+                metadatas = [metadatas[i] for i in changed]
+                ids = [ids[i] for i in changed]
+
+        # Embed and upsert batches in parallel; ONNX inference and the HNSW insert both release the GIL.
+        # Upserting keeps the existing HNSW graph on refresh instead of rebuilding it.
+        if documents:
+            batch_size = Config.CHROMA_BATCH_SIZE
+            starts = range(0, len(documents), batch_size)
+            with ThreadPoolExecutor(max_workers=Config.INGEST_WORKERS) as executor:
+                list(executor.map(
+                    lambda i: _upsert_player_batch(
+                        collection,
+                        embedding_function,
+                        documents[i:i + batch_size],
+                        metadatas[i:i + batch_size],
+                        ids[i:i + batch_size]
+                    ),
+                    starts
+                ))
+            logger.info(f"Upserted {len(documents)} players into ChromaDB collection")
+
+        # Remove players that are no longer in the dataset
+        if force_refresh:
+            stale_ids = stored_documents.keys() - set(all_ids)
+            if stale_ids:
+                collection.delete(ids=list(stale_ids))
+                logger.info(f"Removed {len(stale_ids)} stale players from ChromaDB collection")
 
         return collection
 
     except Exception as e:
         logger.error(f"Error initializing ChromaDB: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+
+class QueryBatcher:
+    """Coalesce concurrent vector searches into one collection.query call"""
+
+    # Per-query fields of a collection.query result
+    RESULT_KEYS = ('ids', 'distances', 'metadatas', 'documents', 'embeddings')
+
+    def __init__(self, max_batch_size=32, max_wait=0.05):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def query(self, query_text, n_results=1):
+        """Search for a single query text; returns a result shaped like collection.query"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((query_text, n_results, future))
+        return future.result()
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._worker_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="chroma-query-batcher", daemon=True)
+                    self._worker.start()
+
+    def _run(self):
+        while True:
+            # Block for the first query, then gather more until the batch is full or the window closes
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        try:
+            collection = get_player_collection()
+            if collection is None:
+                raise RuntimeError("Player collection is unavailable")
+
+            n_results = max(n for _, n, _ in batch)
+            # Repeated queries reuse their cached embedding; the rest are embedded in one model call
+            query_embeddings = embed_queries([normalize_query(text) for text, _, _ in batch])
+            results = collection.query(query_embeddings=query_embeddings, n_results=n_results)
+
+            for i, (_, n, future) in enumerate(batch):
+                future.set_result({
+                    key: [results[key][i][:n]]
+                    for key in self.RESULT_KEYS
+                    if results.get(key) is not None
+                })
+        except Exception as e:
+            logger.error(f"Error running batched ChromaDB query: {str(e)}")
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+
+query_batcher = QueryBatcher(
+    max_batch_size=Config.QUERY_BATCH_MAX_SIZE,
+    max_wait=Config.QUERY_BATCH_WAIT_MS / 1000
+)
@@ -1,15 +1,77 @@
+import json
 import logging
-from flask import Blueprint, request, jsonify
-from db.chroma_db import get_player_collection, validate_cricket_query
-from services.player_service import update_csv_data, search_player_by_name, format_player_info, format_player_list
-from services.gemini_service import get_gemini_response, model
+import re
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from flask_cors import CORS
+from config import Config
+from db.chroma_db import get_player_collection, get_collection_version, validate_cricket_query, query_batcher
+from services.player_service import (update_csv_data, search_player_by_name, format_player_info, format_player_list,
+                                     format_ranked_players, format_team, runs_stat, wickets_stat, runs_and_wickets_stat)
+from services.cache_service import TTLCache
+from services.gemini_service import get_gemini_response, get_gemini_response_stream, model
+from services.player_index import get_player_index, compile_phrase_pattern, match_phrases
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# Greetings, optionally drawn out ("hiii") or followed by "there" and punctuation
+GREETING_RE = re.compile(r'^\s*(hi+|hello+|hey+|greetings|hola|namaste)(\s+there)?[\s!.?]*$', re.IGNORECASE)
+
+# Query phrases -> intent, checked in priority order by query_chatbot
+INTENT_PHRASES = {
+    'best batsman': 'best_batsman',
+    'best bowler': 'best_bowler',
+    'best all-rounder': 'best_all_rounder',
+    'best all rounder': 'best_all_rounder',
+    'best allrounder': 'best_all_rounder',
+    'best players': 'best_players',
+    'best team': 'best_team',
+    'batsmen': 'batsmen',
+    'batsman list': 'batsmen',
+    'bowlers': 'bowlers',
+    'bowler list': 'bowlers',
+    'all-rounders': 'all_rounders',
+    'all rounders': 'all_rounders',
+    'allrounders': 'all_rounders',
+    'players': 'players'
+}
+INTENT_RE = compile_phrase_pattern(INTENT_PHRASES)
+
+# Query responses by (collection version, lowercase query, Gemini enabled); a player
+# data update bumps the collection version, so stale entries are never served
+response_cache = TTLCache(Config.RESPONSE_CACHE_SIZE, Config.RESPONSE_CACHE_TTL)
+
 # Create Blueprint
 chatbot_bp = Blueprint("chatbot", __name__)
 
+# CORS only on chatbot routes; browsers cache preflight responses for CORS_MAX_AGE seconds
+CORS(chatbot_bp, origins=Config.CORS_ORIGINS, max_age=Config.CORS_MAX_AGE)
+
+
+def stream_gemini_response(query, context, detailed=False):
+    """Stream a Gemini answer as server-sent events; None if Gemini produced nothing"""
+    chunks = get_gemini_response_stream(query, context, detailed)
+    first_chunk = next(chunks, None)
+    if first_chunk is None:
+        return None
+
+    def events():
+        yield f"data: {json.dumps({'response': first_chunk})}\n\n"
+        for chunk in chunks:
+            yield f"data: {json.dumps({'response': chunk})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream")
+
+
+def fallback_response(formatted_response):
+    """Formatted answer given in place of Gemini's; marked no-store while Gemini is enabled so
+    a failed Gemini call is retried on the next request instead of its fallback being cached"""
+    response = jsonify({"response": formatted_response})
+    if model:
+        response.cache_control.no_store = True
+    return response
+
 
 @chatbot_bp.route("/", methods=["GET"])
 def home():
@@ -32,9 +94,12 @@ def update_player_data():
 
         # Reinitialize ChromaDB with updated data
         if csv_update_success:
-            # Force refresh the player collection by clearing the LRU cache
+            # Force refresh the shared player collection
             collection = get_player_collection(force_refresh=True)
             if collection:
+                # Cached answers were generated from the old player data
+                get_gemini_response.cache_clear()
+                response_cache.clear()
                 return jsonify({
                     "success": True,
                     "message": "Player data updated in RAG database successfully"
@@ -61,15 +126,44 @@ def update_player_data():
 @chatbot_bp.route("/query/", methods=["GET"])
 def query_chatbot():
     query = request.args.get("query", "").strip()
-
+    # Long Gemini answers can be streamed as server-sent events with ?stream=1
+    stream = request.args.get("stream", "").lower() in ("1", "true", "yes")
+    if stream:
+        return answer_query(query, stream)
+
+    # Empty, greeting and non-cricket queries get fixed answers without touching ChromaDB,
+    # so they skip the response cache and its collection version lookup
+    if not query or GREETING_RE.match(query) or not validate_cricket_query(query):
+        response = answer_query(query, stream)
+        response.add_etag()
+        return response.make_conditional(request)
+
+    # Serve repeated queries from the response cache; the ETag lets clients revalidate
+    # with If-None-Match and get an empty 304 while the answer is unchanged
+    query_key = (query.lower(), model is not None)
+    cached = response_cache.get((get_collection_version(), *query_key))
+    if cached is None:
+        response = answer_query(query, stream)
+        if response.cache_control.no_store:
+            return response
+        response.add_etag()
+        # Keyed by the version the answer was built from; the first query may load the collection
+        response_cache.set((get_collection_version(), *query_key), (response.get_data(), response.get_etag()[0]))
+    else:
+        body, etag = cached
+        response = Response(body, mimetype="application/json")
+        response.set_etag(etag)
+
+    return response.make_conditional(request)
+
+
+def answer_query(query, stream=False):
+    """Answer a chatbot query; error and Gemini fallback responses are marked no-store so they are never cached"""
     if not query:
         return jsonify({"response": "Please provide a query."})
 
     # Handle greetings and general chat
-    query_lower = query.lower()
-    greeting_words = ["hi", "hello", "hey", "greetings", "hola"]
-
-    if any(word == query_lower for word in greeting_words):
+    if GREETING_RE.match(query):
         response = "Hello! Welcome to SpiritxBot. I can help you with cricket player information. Ask me about players, batsmen, bowlers, all-rounders, or the best cricket team!"
         return jsonify({"response": response})
 
@@ -79,77 +173,37 @@ def query_chatbot():
 
     collection = get_player_collection()
     if not collection:
-        return jsonify({"response": "Error accessing player database. Please try again later."})
+        response = jsonify({"response": "Error accessing player database. Please try again later."})
+        response.cache_control.no_store = True
+        return response
+
+    query_lower = query.lower()
 
     try:
-        # Get all players for filtering and analysis
-        players_result = collection.get()
-        if not players_result or not players_result['metadatas']:
-            return jsonify({"response": "No players found in the database."})
+        # Intents mentioned in the query, found in a single regex pass
+        intents = match_phrases(INTENT_RE, query_lower, INTENT_PHRASES)
+
+        # Only the intent and player name branches need the player index; other queries
+        # go straight to the vector search without loading every player
+        if intents or "player" in query_lower:
+            # Players, coerced and pre-sorted once per collection version
+            idx = get_player_index()
+            if not idx.players:
+                return jsonify({"response": "No players found in the database."})
+
+            players = idx.players
+            name_hits = match_phrases(idx.name_re, query_lower)
+        else:
+            name_hits = set()
 
-        players = players_result['metadatas']
+        # Player search by name, resolved from the local name matches without a Gemini round trip
+        if "player" in query_lower and name_hits:
+            # Take the first matched player in collection order
+            first_hit = min(name_hits, key=idx.name_positions.__getitem__)
+            player_name = idx.by_name_lower[first_hit]['name']
 
-        # Convert numeric fields to integers for proper sorting and comparison
-        for player in players:
-            try:
-                # Convert runs to int
-                player['total_runs'] = int(player.get('total_runs', player.get('Total Runs', 0)))
-                player['Total Runs'] = player['total_runs']
-
-                # Convert wickets to int
-                player['wickets'] = int(player.get('wickets', player.get('Wickets', 0)))
-                player['Wickets'] = player['wickets']
-
-                # Convert base price to int
-                player['base_price'] = int(player.get('base_price', player.get('Base Price', 0)))
-                player['Base Price'] = player['base_price']
-
-                # Extract other fields for consistency
-                player['name'] = player.get('name', player.get('Name', ''))
-                player['Name'] = player['name']
-
-                player['category'] = player.get('category', player.get('Category', ''))
-                player['Category'] = player['category']
-
-                player['role'] = player.get('role', player.get('Role', ''))
-                player['Role'] = player['role']
-
-                # Add other fields
-                player['runs_conceded'] = int(player.get('runs_conceded', player.get('Runs Conceded', 0)))
-                player['Runs Conceded'] = player['runs_conceded']
-
-                player['innings_played'] = int(player.get('innings_played', player.get('Innings Played', 0)))
-                player['Innings Played'] = player['innings_played']
-
-                player['overs_bowled'] = float(player.get('overs_bowled', player.get('Overs Bowled', 0)))
-                player['Overs Bowled'] = player['overs_bowled']
-            except (ValueError, TypeError) as e:
-                logger.warning(f"Error converting player stats: {str(e)}")
-
-        # Player search by name
-        if "player" in query_lower and any(name in query_lower for name in [p['name'].lower() for p in players]):
-            # Use Gemini to understand the query better
-            gemini_analysis = None
-            if model:
-                try:
-                    prompt = f"""
-                    Analyze this cricket player search query: "{query}"
-                    Extract the player name the user is looking for.
-                    Return ONLY the player name, nothing else.
-                    """
-                    gemini_analysis = model.generate_content(prompt).text.strip()
-                except Exception as e:
-                    logger.error(f"Error analyzing query with Gemini: {str(e)}")
-
-            # If Gemini couldn't help, try direct matching
-            if not gemini_analysis:
-                for player in players:
-                    if player['name'].lower() in query_lower:
-                        gemini_analysis = player['name']
-                        break
-
-            if gemini_analysis:
-                matched_players = search_player_by_name(players, gemini_analysis)
+            if player_name:
+                matched_players = search_player_by_name(players, player_name, idx.name_lower_array)
                 if matched_players:
                     # Use Gemini to generate a better response
                     if model and len(matched_players) == 1:
@@ -161,7 +215,7 @@ def query_chatbot():
                     # If Gemini response wasn't generated, format a readable response manually
                     if len(matched_players) == 1:
                         formatted_response = format_player_info(matched_players[0])
-                        return jsonify({"response": formatted_response})
+                        return fallback_response(formatted_response)
                     else:
                         # Multiple players matched - create a readable list
                         player_names = [p['name'] for p in matched_players]
@@ -169,17 +223,10 @@ def query_chatbot():
                         return jsonify({"response": formatted_response})
 
         # Best batsman query
-        if "best batsman" in query_lower:
-            # Sort by runs, then by base price as a tiebreaker
-            sorted_batsmen = sorted(
-                [p for p in players if p['role'].lower() == 'batsman'],
-                key=lambda p: (p['total_runs'], p['base_price']),
-                reverse=True
-            )
-
-            # Get the best batsman
-            if sorted_batsmen:
-                best_batsman = sorted_batsmen[0]
+        if "best_batsman" in intents:
+            # Most runs, then highest base price as a tiebreaker
+            best_batsman = idx.best_batsman
+            if best_batsman:
 
                 # Use Gemini to enhance the response
                 if model:
@@ -191,26 +238,19 @@ def query_chatbot():
                 # Fallback to formatted response if Gemini fails
                 formatted_response = f"""
                 The best batsman is {best_batsman['name']} with {best_batsman['total_runs']} runs.
-                Base Price: ₹{best_batsman['base_price']:,}
+                Base Price: {best_batsman['_base_price_str']}
 
                 {format_player_info(best_batsman)}
                 """
-                return jsonify({"response": formatted_response})
+                return fallback_response(formatted_response)
             else:
                 return jsonify({"response": "No specialized batsmen found in the database."})
 
         # Best bowler query
-        elif "best bowler" in query_lower:
-            # Sort by wickets, then by base price as a tiebreaker
-            sorted_bowlers = sorted(
-                [p for p in players if p['role'].lower() == 'bowler'],
-                key=lambda p: (p['wickets'], p['base_price']),
-                reverse=True
-            )
-
-            # Get the best bowler
-            if sorted_bowlers:
-                best_bowler = sorted_bowlers[0]
+        elif "best_bowler" in intents:
+            # Most wickets, then highest base price as a tiebreaker
+            best_bowler = idx.best_bowler
+            if best_bowler:
 
                 # Use Gemini to enhance the response
                 if model:
@@ -222,30 +262,19 @@ def query_chatbot():
                 # Fallback to formatted response if Gemini fails
                 formatted_response = f"""
                 The best bowler is {best_bowler['name']} with {best_bowler['wickets']} wickets.
-                Base Price: ₹{best_bowler['base_price']:,}
+                Base Price: {best_bowler['_base_price_str']}
 
                 {format_player_info(best_bowler)}
                 """
-                return jsonify({"response": formatted_response})
+                return fallback_response(formatted_response)
             else:
                 return jsonify({"response": "No specialized bowlers found in the database."})
 
         # Best all-rounder query
-        elif "best all-rounder" in query_lower or "best all rounder" in query_lower or "best allrounder" in query_lower:
-            # Define a scoring function for all-rounders
-            def all_rounder_score(player):
-                # Simple metric: sum of runs and wickets*10 (typical cricket weighting)
-                return player['total_runs'] + (player['wickets'] * 10)
-
-            # Sort all-rounders by our scoring function, then by base price as tiebreaker
-            sorted_all_rounders = sorted(
-                [p for p in players if p['role'].lower() == 'all-rounder'],
-                key=lambda p: (all_rounder_score(p), p['base_price']),
-                reverse=True
-            )
-
-            if sorted_all_rounders:
-                best_all_rounder = sorted_all_rounders[0]
+        elif "best_all_rounder" in intents:
+            # Highest all-rounder score, then highest base price as tiebreaker
+            best_all_rounder = idx.best_all_rounder
+            if best_all_rounder:
 
                 # Use Gemini to enhance the response
                 if model:
@@ -257,127 +286,63 @@ def query_chatbot():
                 # Fallback to formatted response if Gemini fails
                 formatted_response = f"""
                 The best all-rounder is {best_all_rounder['name']} with {best_all_rounder['total_runs']} runs and {best_all_rounder['wickets']} wickets.
-                Base Price: ₹{best_all_rounder['base_price']:,}
+                Base Price: {best_all_rounder['_base_price_str']}
 
                 {format_player_info(best_all_rounder)}
                 """
-                return jsonify({"response": formatted_response})
+                return fallback_response(formatted_response)
             else:
                 return jsonify({"response": "No all-rounders found in the database."})
 
         # Best players query
-        elif "best players" in query_lower:
-            # Sort players primarily by base price in descending order
-            sorted_players = sorted(
-                players,
-                key=lambda p: p['base_price'],
-                reverse=True
-            )
+        elif "best_players" in intents:
+            # Players sorted by base price in descending order
+            sorted_players = idx.all_by_price
 
             # Use Gemini to enhance the response
             if model and sorted_players:
                 context = sorted_players[:5]  # Use top 5 players as context
-                response = get_gemini_response("Who are the best cricket players?", context)
-                if response:
-                    return jsonify({"response": response})
+                if stream:
+                    streamed_response = stream_gemini_response("Who are the best cricket players?", context)
+                    if streamed_response:
+                        return streamed_response
+                else:
+                    response = get_gemini_response("Who are the best cricket players?", context)
+                    if response:
+                        return jsonify({"response": response})
 
             # Fallback to formatted response if Gemini fails
             top_players = sorted_players[:10]
-            formatted_response = "Here are the top cricket players based on their value:\n\n"
-            for i, player in enumerate(top_players, 1):
-                formatted_response += f"{i}. {player['name']} - {player['role']} - Base Price: ₹{player['base_price']:,} - Runs: {player['total_runs']}, Wickets: {player['wickets']}\n"
+            formatted_response = ("Here are the top cricket players based on their value:\n\n"
+                                  + format_ranked_players(top_players, runs_and_wickets_stat, show_role=True))
 
-            return jsonify({"response": formatted_response})
+            return fallback_response(formatted_response)
 
         # Best team query
-        elif "best team" in query_lower:
-            # Sort all players primarily by base price in descending order
-            sorted_by_price = sorted(players, key=lambda p: p['base_price'], reverse=True)
-
-            # Identify players by role
-            batsmen = [p for p in sorted_by_price if p['role'].lower() == 'batsman']
-            bowlers = [p for p in sorted_by_price if p['role'].lower() == 'bowler']
-            all_rounders = [p for p in sorted_by_price if p['role'].lower() == 'all-rounder']
-
-            # Build a balanced team of 11 players based on value and role
-            team = []
-            player_ids = set()  # To avoid duplicates
-
-            # Add top batsmen (prioritizing value)
-            for player in batsmen:
-                if len(team) >= 5:
-                    break
-                if player['name'] not in player_ids:
-                    team.append(player)
-                    player_ids.add(player['name'])
-
-            # Add top all-rounders (crucial for balance)
-            for player in all_rounders:
-                if len(team) >= 7:
-                    break
-                if player['name'] not in player_ids:
-                    team.append(player)
-                    player_ids.add(player['name'])
-
-            # Add top bowlers
-            for player in bowlers:
-                if len(team) >= 11:
-                    break
-                if player['name'] not in player_ids:
-                    team.append(player)
-                    player_ids.add(player['name'])
-
-            # If we still need players and have more all-rounders, add them
-            if len(team) < 11 and all_rounders:
-                for player in all_rounders:
-                    if len(team) >= 11:
-                        break
-                    if player['name'] not in player_ids:
-                        team.append(player)
-                        player_ids.add(player['name'])
-
-            # If still need players, add more batsmen or bowlers
-            remaining_players = [p for p in sorted_by_price if p['name'] not in player_ids]
-
-            for player in remaining_players:
-                if len(team) >= 11:
-                    break
-                team.append(player)
-                player_ids.add(player['name'])
+        elif "best_team" in intents:
+            # Balanced team of 11 players based on value and role, selected once per index
+            team = idx.best_team
 
             # Use Gemini to enhance the response
             if model and team:
                 context = team
-                response = get_gemini_response("Create the best cricket team with these players", context)
-                if response:
-                    return jsonify({"response": response})
+                if stream:
+                    streamed_response = stream_gemini_response("Create the best cricket team with these players", context)
+                    if streamed_response:
+                        return streamed_response
+                else:
+                    response = get_gemini_response("Create the best cricket team with these players", context)
+                    if response:
+                        return jsonify({"response": response})
 
             # Fallback to formatted response if Gemini fails
-            formatted_response = "Here's the best cricket team based on player value and role:\n\n"
-            formatted_response += "BATSMEN:\n"
-            for player in [p for p in team if p['role'].lower() == 'batsman']:
-                formatted_response += f"- {player['name']} (Base Price: ₹{player['base_price']:,}, Runs: {player['total_runs']})\n"
-
-            formatted_response += "\nBOWLERS:\n"
-            for player in [p for p in team if p['role'].lower() == 'bowler']:
-                formatted_response += f"- {player['name']} (Base Price: ₹{player['base_price']:,}, Wickets: {player['wickets']})\n"
-
-            formatted_response += "\nALL-ROUNDERS:\n"
-            for player in [p for p in team if p['role'].lower() == 'all-rounder']:
-                formatted_response += f"- {player['name']} (Base Price: ₹{player['base_price']:,}, Runs: {player['total_runs']}, Wickets: {player['wickets']})\n"
-
-            return jsonify({"response": formatted_response})
+            formatted_response = format_team(team)
+            return fallback_response(formatted_response)
 
         # Player type queries - individual types
-        elif "batsmen" in query_lower or "batsman list" in query_lower:
+        elif "batsmen" in intents:
             # Return top batsmen by base price
-            sorted_batsmen = sorted(
-                [p for p in players if p['role'].lower() == 'batsman'],
-                key=lambda p: p['base_price'],
-                reverse=True
-            )
-
-            top_batsmen = sorted_batsmen[:10]
+            top_batsmen = idx.batsmen_by_price[:10]
 
             # Use Gemini for enhanced response
             if model and top_batsmen:
@@ -387,21 +352,13 @@ def query_chatbot():
                     return jsonify({"response": response})
 
             # Fallback formatted response
-            formatted_response = "Top Batsmen by Value:\n\n"
-            for i, player in enumerate(top_batsmen, 1):
-                formatted_response += f"{i}. {player['name']} - Base Price: ₹{player['base_price']:,} - Runs: {player['total_runs']}\n"
+            formatted_response = "Top Batsmen by Value:\n\n" + format_ranked_players(top_batsmen, runs_stat)
 
-            return jsonify({"response": formatted_response})
+            return fallback_response(formatted_response)
 
-        elif "bowlers" in query_lower or "bowler list" in query_lower:
+        elif "bowlers" in intents:
             # Return top bowlers by base price
-            sorted_bowlers = sorted(
-                [p for p in players if p['role'].lower() == 'bowler'],
-                key=lambda p: p['base_price'],
-                reverse=True
-            )
-
-            top_bowlers = sorted_bowlers[:10]
+            top_bowlers = idx.bowlers_by_price[:10]
 
             # Use Gemini for enhanced response
             if model and top_bowlers:
@@ -411,21 +368,13 @@ def query_chatbot():
                     return jsonify({"response": response})
 
             # Fallback formatted response
-            formatted_response = "Top Bowlers by Value:\n\n"
-            for i, player in enumerate(top_bowlers, 1):
-                formatted_response += f"{i}. {player['name']} - Base Price: ₹{player['base_price']:,} - Wickets: {player['wickets']}\n"
+            formatted_response = "Top Bowlers by Value:\n\n" + format_ranked_players(top_bowlers, wickets_stat)
 
-            return jsonify({"response": formatted_response})
+            return fallback_response(formatted_response)
 
-        elif "all-rounders" in query_lower or "all rounders" in query_lower or "allrounders" in query_lower:
+        elif "all_rounders" in intents:
             # Return top all-rounders by base price
-            sorted_all_rounders = sorted(
-                [p for p in players if p['role'].lower() == 'all-rounder'],
-                key=lambda p: p['base_price'],
-                reverse=True
-            )
-
-            top_all_rounders = sorted_all_rounders[:10]
+            top_all_rounders = idx.all_rounders_by_price[:10]
 
             # Use Gemini for enhanced response
             if model and top_all_rounders:
@@ -435,77 +384,37 @@ def query_chatbot():
                     return jsonify({"response": response})
 
             # Fallback formatted response
-            formatted_response = "Top All-Rounders by Value:\n\n"
-            for i, player in enumerate(top_all_rounders, 1):
-                formatted_response += f"{i}. {player['name']} - Base Price: ₹{player['base_price']:,} - Runs: {player['total_runs']}, Wickets: {player['wickets']}\n"
+            formatted_response = "Top All-Rounders by Value:\n\n" + format_ranked_players(top_all_rounders, runs_and_wickets_stat)
 
-            return jsonify({"response": formatted_response})
+            return fallback_response(formatted_response)
 
         # Combined player types query
-        elif "players" in query_lower:
-            # Use Gemini to understand what types of players the user wants
+        elif "players" in intents:
+            # Detect the requested player types from keywords
             player_types = []
-            if model:
-                try:
-                    prompt = f"""
-                    Analyze this cricket query: "{query}"
-                    What types of players is the user asking for? Choose from: batsmen, bowlers, all-rounders.
-                    If multiple types are mentioned, list them all separated by commas.
-                    Return ONLY the player types, nothing else.
-                    """
-                    player_types_text = model.generate_content(prompt).text.strip()
-                    player_types = [t.strip().lower() for t in player_types_text.split(',')]
-                except Exception as e:
-                    logger.error(f"Error analyzing query with Gemini: {str(e)}")
-
-            # If Gemini failed or didn't detect specific types, check for keywords
-            if not player_types:
-                if "batsman" in query_lower or "batsmen" in query_lower:
-                    player_types.append("batsmen")
-                if "bowler" in query_lower or "bowlers" in query_lower:
-                    player_types.append("bowlers")
-                if "all-rounder" in query_lower or "all rounder" in query_lower or "allrounder" in query_lower:
-                    player_types.append("all-rounders")
+            if "batsman" in query_lower or "batsmen" in query_lower:
+                player_types.append("batsmen")
+            if "bowler" in query_lower or "bowlers" in query_lower:
+                player_types.append("bowlers")
+            if "all-rounder" in query_lower or "all rounder" in query_lower or "allrounder" in query_lower:
+                player_types.append("all-rounders")
 
             # If we've identified specific player types
             if player_types:
                 result = {}
-                formatted_response = "Here are the players you asked about:\n\n"
+                parts = ["Here are the players you asked about:\n\n"]
 
                 if "batsmen" in player_types:
-                    sorted_batsmen = sorted(
-                        [p for p in players if p['role'].lower() == 'batsman'],
-                        key=lambda p: p['base_price'],
-                        reverse=True
-                    )
-                    result["batsmen"] = sorted_batsmen[:5]
-                    formatted_response += "Top Batsmen by Value:\n"
-                    for i, player in enumerate(sorted_batsmen[:5], 1):
-                        formatted_response += f"{i}. {player['name']} - Base Price: ₹{player['base_price']:,} - Runs: {player['total_runs']}\n"
-                    formatted_response += "\n"
+                    result["batsmen"] = idx.batsmen_by_price[:5]
+                    parts += ["Top Batsmen by Value:\n", format_ranked_players(result["batsmen"], runs_stat), "\n"]
 
                 if "bowlers" in player_types:
-                    sorted_bowlers = sorted(
-                        [p for p in players if p['role'].lower() == 'bowler'],
-                        key=lambda p: p['base_price'],
-                        reverse=True
-                    )
-                    result["bowlers"] = sorted_bowlers[:5]
-                    formatted_response += "Top Bowlers by Value:\n"
-                    for i, player in enumerate(sorted_bowlers[:5], 1):
-                        formatted_response += f"{i}. {player['name']} - Base Price: ₹{player['base_price']:,} - Wickets: {player['wickets']}\n"
-                    formatted_response += "\n"
+                    result["bowlers"] = idx.bowlers_by_price[:5]
+                    parts += ["Top Bowlers by Value:\n", format_ranked_players(result["bowlers"], wickets_stat), "\n"]
 
                 if "all-rounders" in player_types:
-                    sorted_all_rounders = sorted(
-                        [p for p in players if p['role'].lower() == 'all-rounder'],
-                        key=lambda p: p['base_price'],
-                        reverse=True
-                    )
-                    result["all_rounders"] = sorted_all_rounders[:5]
-                    formatted_response += "Top All-Rounders by Value:\n"
-                    for i, player in enumerate(sorted_all_rounders[:5], 1):
-                        formatted_response += f"{i}. {player['name']} - Base Price: ₹{player['base_price']:,} - Runs: {player['total_runs']}, Wickets: {player['wickets']}\n"
+                    result["all_rounders"] = idx.all_rounders_by_price[:5]
+                    parts += ["Top All-Rounders by Value:\n", format_ranked_players(result["all_rounders"], runs_and_wickets_stat)]
 
                 # Use Gemini to create a meaningful response
                 if model and result:
@@ -513,28 +422,14 @@ def query_chatbot():
                     if response:
                         return jsonify({"response": response})
 
-                return jsonify({"response": formatted_response})
+                return fallback_response("".join(parts))
 
             # If no specific types identified, return top players of each type
             else:
-                # Sort players by role and base price
-                batsmen = sorted(
-                    [p for p in players if p['role'].lower() == 'batsman'],
-                    key=lambda p: p['base_price'],
-                    reverse=True
-                )[:5]
-
-                bowlers = sorted(
-                    [p for p in players if p['role'].lower() == 'bowler'],
-                    key=lambda p: p['base_price'],
-                    reverse=True
-                )[:5]
-
-                all_rounders = sorted(
-                    [p for p in players if p['role'].lower() == 'all-rounder'],
-                    key=lambda p: p['base_price'],
-                    reverse=True
-                )[:5]
+                # Top players of each role by base price
+                batsmen = idx.batsmen_by_price[:5]
+                bowlers = idx.bowlers_by_price[:5]
+                all_rounders = idx.all_rounders_by_price[:5]
 
                 # Use Gemini to create a meaningful response
                 if model:
@@ -548,57 +443,50 @@ def query_chatbot():
                         return jsonify({"response": response})
 
                 # Fallback formatted response
-                formatted_response = "Here are the top cricket players across all categories by value:\n\n"
+                formatted_response = "".join([
+                    "Here are the top cricket players across all categories by value:\n\n",
+                    "Top Batsmen:\n", format_ranked_players(batsmen, runs_stat),
+                    "\nTop Bowlers:\n", format_ranked_players(bowlers, wickets_stat),
+                    "\nTop All-Rounders:\n", format_ranked_players(all_rounders, runs_and_wickets_stat)
+                ])
 
-                formatted_response += "Top Batsmen:\n"
-                for i, player in enumerate(batsmen, 1):
-                    formatted_response += f"{i}. {player['name']} - Base Price: ₹{player['base_price']:,} - Runs: {player['total_runs']}\n"
+                return fallback_response(formatted_response)
 
-                formatted_response += "\nTop Bowlers:\n"
-                for i, player in enumerate(bowlers, 1):
-                    formatted_response += f"{i}. {player['name']} - Base Price: ₹{player['base_price']:,} - Wickets: {player['wickets']}\n"
-
-                formatted_response += "\nTop All-Rounders:\n"
-                for i, player in enumerate(all_rounders, 1):
-                    formatted_response += f"{i}. {player['name']} - Base Price: ₹{player['base_price']:,} - Runs: {player['total_runs']}, Wickets: {player['wickets']}\n"
-
-                return jsonify({"response": formatted_response})
-
-        # Default to Gemini for understanding the user's query
+        # Default to a vector search over the players, answered by Gemini when available
         if model:
             try:
-                gemini_query = f"""
-                Analyze this cricket query: "{query}"
-                What is the user looking for? (player search, stats comparison, team information, etc.)
-                """
-                query_analysis = model.generate_content(gemini_query).text
-
-                # Try to get results based on Gemini's analysis
-                # First try ChromaDB for vector search
-                results = collection.query(query_texts=[query], n_results=3)
+                results = query_batcher.query(query, n_results=3)
                 if results and results['metadatas'] and results['metadatas'][0]:
-                    # Use Gemini to generate a response based on query and results
+                    # Use Gemini to generate a response based on query and results; free-form
+                    # questions can ask about any field, so the results are sent in full
                     context = results['metadatas'][0]
-                    response = get_gemini_response(query, context)
-                    if response:
-                        return jsonify({"response": response})
+                    if stream:
+                        streamed_response = stream_gemini_response(query, context, detailed=True)
+                        if streamed_response:
+                            return streamed_response
+                    else:
+                        response = get_gemini_response(query, context, detailed=True)
+                        if response:
+                            return jsonify({"response": response})
 
-                    # Fallback format response
-                    formatted_response = format_player_info(results['metadatas'][0])
-                    return jsonify({"response": formatted_response})
+                    # Fallback format response for the closest player
+                    formatted_response = format_player_info(results['metadatas'][0][0])
+                    return fallback_response(formatted_response)
             except Exception as e:
-                logger.error(f"Error with Gemini analysis: {str(e)}")
+                logger.error(f"Error with Gemini response: {str(e)}")
 
         # If we reach here, try a basic vector search
-        results = collection.query(query_texts=[query], n_results=1)
+        results = query_batcher.query(query, n_results=1)
         if results and results['metadatas'] and results['metadatas'][0]:
             # Format the response instead of returning raw JSON
-            formatted_response = format_player_info(results['metadatas'][0])
-            return jsonify({"response": formatted_response})
+            formatted_response = format_player_info(results['metadatas'][0][0])
+            return fallback_response(formatted_response)
 
         return jsonify({
             "response": "I couldn't find the information you're looking for. Please try asking about specific cricket players, teams, or statistics."})
 
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
-        return jsonify({"response": "An error occurred while processing your request."})
\ No newline at end of file
+        response = jsonify({"response": "An error occurred while processing your request."})
+        response.cache_control.no_store = True
+        return response
\ No newline at end of file
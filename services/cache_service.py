@@ -0,0 +1,59 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after a fixed number of seconds"""
+
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None if it is missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                timestamp, value = entry
+                if time.monotonic() - timestamp <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return value
+                del self._entries[key]
+            self._misses += 1
+            return None
+
+    def set(self, key, value):
+        """Store value under key, evicting expired and least recently used entries"""
+        with self._lock:
+            now = time.monotonic()
+            self._entries[key] = (now, value)
+            self._entries.move_to_end(key)
+
+            # Evict from the least recently used end while over size or holding expired entries;
+            # expired entries elsewhere are dropped when they are next read
+            while self._entries:
+                oldest_key, (timestamp, _) = next(iter(self._entries.items()))
+                if len(self._entries) <= self.max_size and now - timestamp <= self.ttl:
+                    break
+                del self._entries[oldest_key]
+
+    def clear(self):
+        """Drop every cached entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "size": len(self._entries),
+                "max_size": self.max_size
+            }
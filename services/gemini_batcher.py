@@ -0,0 +1,36 @@
+import threading
+from concurrent.futures import Future
+
+
+class GeminiBatcher:
+    """Coalesce concurrent identical Gemini requests into one call and bound how many run at once
+
+    The Gemini API takes one prompt per request, so rather than merging different prompts the
+    batcher lets every caller asking the same thing while a call is in flight share its result.
+    """
+
+    def __init__(self, max_concurrency=16):
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def submit(self, key, func, *args):
+        """Return func(*args), sharing the result with concurrent callers submitting the same key"""
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+
+        if not leader:
+            return future.result()
+
+        try:
+            with self._slots:
+                future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        return future.result()
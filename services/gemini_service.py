@@ -1,6 +1,10 @@
+import hashlib
+import json
 import logging
 import google.generativeai as genai
 from config import Config
+from services.cache_service import TTLCache
+from services.gemini_batcher import GeminiBatcher
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -8,7 +12,8 @@ logger = logging.getLogger(__name__)
 # Configure Gemini AI
 try:
     if Config.GEMINI_API_KEY:
-        genai.configure(api_key=Config.GEMINI_API_KEY)
+        genai.configure(api_key=Config.GEMINI_API_KEY, transport=Config.GEMINI_TRANSPORT)
+        # One model (and client connection) per process, shared by all request threads
         model = genai.GenerativeModel("gemini-1.5-pro")
     else:
         logger.warning("GEMINI_API_KEY not found. Ensure it is set in .env file.")
@@ -17,17 +22,63 @@ except Exception as e:
     logger.error(f"Error configuring Gemini AI: {str(e)}")
     model = None
 
-def get_gemini_response(query, context=None):
-    """Get enhanced response from Gemini model"""
-    if not model:
+# Responses keyed by normalized query + context hash; cleared when player data changes
+response_cache = TTLCache(max_size=Config.GEMINI_CACHE_SIZE, ttl=Config.GEMINI_CACHE_TTL)
+
+
+# Concurrent requests for the same uncached answer share one Gemini call
+gemini_batcher = GeminiBatcher(max_concurrency=Config.GEMINI_MAX_CONCURRENCY)
+
+
+def _generate_text(prompt):
+    """Run a prompt through Gemini and return the response text"""
+    return model.generate_content(prompt).text
+
+
+# Player fields sent to Gemini: a single player is described in full, players in a ranked list
+# or team briefly; search results are sent in full because they back free-form questions
+PLAYER_DETAIL_FIELDS = ('name', 'university', 'category', 'role', 'total_runs', 'balls_faced',
+                        'innings_played', 'wickets', 'overs_bowled', 'runs_conceded', 'base_price')
+PLAYER_SUMMARY_FIELDS = ('name', 'role', 'total_runs', 'wickets', 'base_price')
+
+
+def _project_player(player, fields):
+    return {field: player[field] for field in fields if field in player}
+
+
+def _compact_context(context, list_fields=PLAYER_SUMMARY_FIELDS):
+    """Reduce a player, a list of players or a dict of player lists to the fields Gemini needs"""
+    if isinstance(context, list):
+        return [_project_player(player, list_fields) if isinstance(player, dict) else player
+                for player in context]
+    if isinstance(context, dict):
+        if 'name' in context:
+            return _project_player(context, PLAYER_DETAIL_FIELDS)
+        return {key: _compact_context(value, list_fields) for key, value in context.items()}
+    return context
+
+
+def _context_json(context, detailed=False):
+    """Serialize the compacted context as minified JSON for the prompt, or None without context"""
+    if not context:
         return None
+    list_fields = PLAYER_DETAIL_FIELDS if detailed else PLAYER_SUMMARY_FIELDS
+    return json.dumps(_compact_context(context, list_fields), separators=(',', ':'), ensure_ascii=False, default=str)
 
-    try:
-        # Create a prompt that includes context if available
-        prompt = query
-        if context:
-            prompt = f"""
-            Given this cricket data: {context}
+
+def _response_cache_key(query, context_json):
+    """Build a cache key from the normalized query and a digest of the serialized context"""
+    context_digest = hashlib.blake2b((context_json or '').encode(), digest_size=16).hexdigest()
+    return query.lower().strip(), context_digest
+
+
+def _build_prompt(query, context_json=None):
+    """Create a prompt that includes the serialized context if available"""
+    if not context_json:
+        return query
+
+    return f"""
+            Given this cricket data: {context_json}
 
             Please provide a meaningful and conversational response to the user query: {query}
 
@@ -41,8 +92,51 @@ def get_gemini_response(query, context=None):
             - When referring to pricing, use the term "base price" or "value" instead
             """
 
-        response = model.generate_content(prompt)
-        return response.text
+
+def get_gemini_response(query, context=None, detailed=False):
+    """Get enhanced response from Gemini model; detailed sends every field of players in lists too"""
+    if not model:
+        return None
+
+    context_json = _context_json(context, detailed)
+    cache_key = _response_cache_key(query, context_json)
+    cached_response = response_cache.get(cache_key)
+    if cached_response is not None:
+        return cached_response
+
+    try:
+        response_text = gemini_batcher.submit(cache_key, _generate_text, _build_prompt(query, context_json))
+        response_cache.set(cache_key, response_text)
+        return response_text
     except Exception as e:
         logger.error(f"Error getting Gemini response: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+
+def get_gemini_response_stream(query, context=None, detailed=False):
+    """Yield the Gemini response in chunks as they are generated; a cached response is one chunk"""
+    if not model:
+        return
+
+    context_json = _context_json(context, detailed)
+    cache_key = _response_cache_key(query, context_json)
+    cached_response = response_cache.get(cache_key)
+    if cached_response is not None:
+        yield cached_response
+        return
+
+    chunks = []
+    try:
+        for chunk in model.generate_content(_build_prompt(query, context_json), stream=True):
+            chunks.append(chunk.text)
+            yield chunk.text
+    except Exception as e:
+        logger.error(f"Error streaming Gemini response: {str(e)}")
+        return
+
+    # Only complete responses are cached
+    response_cache.set(cache_key, "".join(chunks))
+
+
+get_gemini_response.cache_stats = response_cache.stats
+get_gemini_response.cache_clear = response_cache.clear
@@ -0,0 +1,190 @@
+import logging
+import re
+import sys
+import threading
+import numpy as np
+from collections import namedtuple
+from functools import lru_cache
+from db.chroma_db import get_player_collection, get_collection_version, safe_int, safe_float
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Interned lowercase roles; role_lower() returns these same objects, so compare with `is`
+BATSMAN = sys.intern('batsman')
+BOWLER = sys.intern('bowler')
+ALL_ROUNDER = sys.intern('all-rounder')
+
+# Lowercase role -> role id stored in PlayerIndex.role_id; any other role is ROLE_OTHER
+ROLE_IDS = {BATSMAN: 0, BOWLER: 1, ALL_ROUNDER: 2}
+ROLE_BATSMAN, ROLE_BOWLER, ROLE_ALL_ROUNDER, ROLE_OTHER = 0, 1, 2, 3
+
+# Player lists prepared once per collection version. Rankings are computed on NumPy
+# columns aligned with players; all sorts are descending and stable and the best player
+# is the first of equal maxima, so ties keep their collection order.
+PlayerIndex = namedtuple('PlayerIndex', [
+    'players',                # every player with numeric fields coerced
+    'by_name_lower',          # lowercase name -> player
+    'name_positions',         # lowercase name -> position of its first player in collection order
+    'name_lower_array',       # names in collection order for vectorized search; ASCII as lowercase bytes, else casefolded
+    'name_re',                # finds every lowercase name in a lowercase query, or None
+    'all_by_price',           # every player by base price
+    'batsmen_by_price',
+    'bowlers_by_price',
+    'all_rounders_by_price',
+    'best_batsman',           # top (total runs, base price), or None
+    'best_bowler',            # top (wickets, base price), or None
+    'best_all_rounder',       # top (all-rounder score, base price), or None
+    'best_team'               # balanced team of up to TEAM_SIZE players
+])
+
+# Best team: (players by price, team size to fill up to from them), tried in order
+TEAM_SIZE = 11
+TEAM_QUOTAS = (
+    ('batsmen_by_price', 5),
+    ('all_rounders_by_price', 7),
+    ('bowlers_by_price', TEAM_SIZE),
+    ('all_rounders_by_price', TEAM_SIZE),
+    ('all_by_price', TEAM_SIZE)
+)
+
+
+def compile_phrase_pattern(phrases):
+    """Compile phrases into one regex that reports every phrase occurring in a text
+
+    The lookahead lets matches overlap, and longer phrases are tried first so a phrase
+    is not cut short by one of its own prefixes.
+    """
+    phrases = sorted({phrase for phrase in phrases if phrase}, key=len, reverse=True)
+    if not phrases:
+        return None
+    return re.compile('(?=(' + '|'.join(map(re.escape, phrases)) + '))')
+
+
+def match_phrases(pattern, text, mapping=None):
+    """Set of phrases (or their mapped values) that pattern finds in text"""
+    if pattern is None:
+        return set()
+    found = {match.group(1) for match in pattern.finditer(text)}
+    return {mapping[phrase] for phrase in found} if mapping else found
+
+
+@lru_cache(maxsize=64)
+def role_lower(role):
+    """Interned lowercase form of a role, computed once per distinct role"""
+    return sys.intern(role.lower())
+
+
+def all_rounder_scores(runs, wickets):
+    """Simple all-rounder metric per player: runs plus wickets*10 (typical cricket weighting)"""
+    return runs.astype(np.int64) + wickets.astype(np.int64) * 10
+
+
+def name_search_array(names):
+    """NumPy array of names for np.char.find: lowercase bytes when every name is ASCII, else casefolded strings
+
+    Lowercasing is a complete case fold for ASCII; only other scripts need the costlier casefold.
+    """
+    if all(name.isascii() for name in names):
+        return np.array([name.lower() for name in names], dtype=bytes)
+    return np.array([name.casefold() for name in names], dtype=str)
+
+
+def _coerce_player(player):
+    """Convert a player's numeric metadata fields to typed values in place"""
+    for field in ('total_runs', 'wickets', 'base_price', 'runs_conceded', 'innings_played'):
+        player[field] = safe_int(player.get(field, 0))
+    player['overs_bowled'] = safe_float(player.get('overs_bowled', 0))
+    # Rendered in most responses, so format the price once per index build
+    player['_base_price_str'] = f"₹{player['base_price']:,}"
+    player.setdefault('name', '')
+    player.setdefault('category', '')
+    player.setdefault('role', '')
+    return player
+
+
+def _by_price(base_price, positions):
+    """Positions ordered by base price, highest first, ties in collection order"""
+    return positions[np.argsort(-base_price[positions], kind='stable')]
+
+
+def _best(positions, *keys):
+    """Position of the first player with the highest keys (most significant first), or None"""
+    if not len(positions):
+        return None
+    # lexsort sorts by its last key first; ascending on negated keys is stable, so the
+    # first entry is the earliest of the equal maxima
+    return positions[np.lexsort([-key[positions] for key in reversed(keys)])[0]]
+
+
+def select_best_team(lists):
+    """Fill a team by value in one pass over the role quotas, skipping repeated names"""
+    team = []
+    team_names = set()
+    for list_name, team_size in TEAM_QUOTAS:
+        for player in lists[list_name]:
+            if len(team) >= team_size:
+                break
+            if player['name'] not in team_names:
+                team.append(player)
+                team_names.add(player['name'])
+    return team
+
+
+@lru_cache(maxsize=1)
+def build_index(collection_version):
+    """Load every player from the collection and prepare the lists the chatbot queries use"""
+    collection = get_player_collection()
+    players_result = collection.get(include=["metadatas"]) if collection else None
+    raw_players = players_result['metadatas'] if players_result and players_result['metadatas'] else []
+    players = [_coerce_player(player) for player in raw_players]
+    logger.info(f"Built player index for collection version {collection_version} with {len(players)} players")
+
+    # Structure-of-arrays columns for ranking
+    count = len(players)
+    runs = np.fromiter((p['total_runs'] for p in players), dtype=np.int32, count=count)
+    wickets = np.fromiter((p['wickets'] for p in players), dtype=np.int32, count=count)
+    base_price = np.fromiter((p['base_price'] for p in players), dtype=np.int64, count=count)
+    role_id = np.fromiter((ROLE_IDS.get(role_lower(p['role']), ROLE_OTHER) for p in players), dtype=np.int8, count=count)
+    all_rounder_score = all_rounder_scores(runs, wickets)
+
+    batsmen = np.flatnonzero(role_id == ROLE_BATSMAN)
+    bowlers = np.flatnonzero(role_id == ROLE_BOWLER)
+    all_rounders = np.flatnonzero(role_id == ROLE_ALL_ROUNDER)
+    pick = lambda positions: [players[i] for i in positions]
+    pick_one = lambda position: players[position] if position is not None else None
+
+    lists = {
+        'all_by_price': pick(_by_price(base_price, np.arange(count))),
+        'batsmen_by_price': pick(_by_price(base_price, batsmen)),
+        'bowlers_by_price': pick(_by_price(base_price, bowlers)),
+        'all_rounders_by_price': pick(_by_price(base_price, all_rounders))
+    }
+
+    name_lowers = tuple(sys.intern(p['name'].lower()) for p in players)
+    name_positions = {}
+    for position, name_lower in enumerate(name_lowers):
+        name_positions.setdefault(name_lower, position)
+    return PlayerIndex(
+        players=players,
+        by_name_lower=dict(zip(name_lowers, players)),
+        name_positions=name_positions,
+        name_lower_array=name_search_array(name_lowers),
+        name_re=compile_phrase_pattern(name_lowers),
+        **lists,
+        best_batsman=pick_one(_best(batsmen, runs, base_price)),
+        best_bowler=pick_one(_best(bowlers, wickets, base_price)),
+        best_all_rounder=pick_one(_best(all_rounders, all_rounder_score, base_price)),
+        best_team=select_best_team(lists)
+    )
+
+
+# Serializes index builds so concurrent requests after a refresh build the new index once
+_index_lock = threading.RLock()
+
+
+def get_player_index():
+    """Get the player index for the current collection version"""
+    version = get_collection_version()
+    with _index_lock:
+        return build_index(version)
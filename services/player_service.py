@@ -1,128 +1,260 @@
 import logging
-import os
+import numpy as np
 import pandas as pd
-from config import Config
-from db.chroma_db import get_player_collection
+from db.chroma_db import (get_player_collection, player_dataset_exists, player_dataset_lock, player_dataset_signature,
+                          load_player_frame, save_player_frame, PLAYER_CSV_DTYPES)
+from services.player_index import role_lower, name_search_array, BATSMAN, BOWLER, ALL_ROUNDER
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# The dataset as last saved by this process and its name -> row positions map, reused while the
+# files on disk are unchanged. Only read and written under player_dataset_lock.
+_dataset_cache = {'df': None, 'name_rows': None, 'signature': None}
+
+# Columns of the row added for a new player, in dataset order
+_NEW_ROW_KEYS = ('Name', 'University', 'Category', 'Total Runs', 'Balls Faced', 'Innings Played',
+                 'Wickets', 'Overs Bowled', 'Runs Conceded', 'Base Price')
+
+# Rupee amount with thousands separators
+_money = "₹{:,}".format
+
+
+def _base_price_str(player):
+    """Formatted base price; index players carry it precomputed, other player dicts are formatted here"""
+    price_str = player.get('_base_price_str')
+    if price_str is None:
+        price_str = _money(int(player.get('base_price', 0)))
+    return price_str
+
+
+def runs_stat(player):
+    return f"Runs: {player['total_runs']}"
+
+
+def wickets_stat(player):
+    return f"Wickets: {player['wickets']}"
+
+
+def runs_and_wickets_stat(player):
+    return f"Runs: {player['total_runs']}, Wickets: {player['wickets']}"
+
 
 def update_csv_data(player_data):
-    """Update the CSV file with new player data from Node.js backend"""
+    """Update the player dataset with new player data from Node.js backend"""
+    try:
+        # Load, apply and save under the dataset lock so updates handled by different workers
+        # cannot save over each other
+        with player_dataset_lock():
+            saved = _update_player_dataset(player_data)
+            if not saved:
+                # The cached frame may hold changes that were never saved
+                _dataset_cache['df'] = None
+            return saved
+    except TimeoutError as e:
+        logger.error(f"Error updating player data: {str(e)}")
+        return False
+
+
+def _update_player_dataset(player_data):
+    """Apply a player update or deletion and save the dataset; returns whether it was saved"""
     try:
-        csv_file_path = Config.DATASET_PATH
         df = None
+        name_rows = None
 
-        # Check if file exists and load it
-        if os.path.exists(csv_file_path):
-            df = pd.read_csv(csv_file_path)
+        # Reuse the frame saved last time unless the files changed since; otherwise load whichever
+        # of the Parquet copy and the CSV is current
+        if _dataset_cache['df'] is not None and _dataset_cache['signature'] == player_dataset_signature():
+            df = _dataset_cache['df']
+            name_rows = _dataset_cache['name_rows']
+        elif player_dataset_exists():
+            # Columns read from Parquet can share read-only Arrow buffers; copy them so they can be updated in place
+            df = load_player_frame().copy()
         else:
-            # Create new dataframe with necessary columns
-            df = pd.DataFrame(columns=[
-                'Name', 'University', 'Category', 'Total Runs', 'Balls Faced',
-                'Innings Played', 'Wickets', 'Overs Bowled', 'Runs Conceded',
-                'Base Price'
-            ])
+            # Create new dataframe with necessary columns and their stored dtypes
+            df = pd.DataFrame({column: pd.Series(dtype=PLAYER_CSV_DTYPES[column]) for column in _NEW_ROW_KEYS})
 
         # Handle player deletion
         if player_data.get('deletePlayer'):
             player_name = player_data.get('name')
             if player_name:
                 df = df[df['Name'] != player_name]
-                logger.info(f"Deleted player {player_name} from CSV")
+                # Row positions shift after a deletion; the map is rebuilt on the next update
+                name_rows = None
+                logger.info(f"Deleted player {player_name} from the player dataset")
             else:
                 logger.warning("Player deletion requested but no name provided")
 
-            # Save updated dataframe
-            df.to_csv(csv_file_path, index=False)
-            return True
-
-        # Handle multiple players
-        if 'players' in player_data:
-            for player in player_data['players']:
-                _update_single_player(df, player, csv_file_path)
-            return True
+        # Handle single or multiple players
+        else:
+            players = player_data['players'] if 'players' in player_data else [player_data]
+            if name_rows is None:
+                name_rows = _name_rows(df)
+            df, applied = _apply_players(df, players, name_rows)
+            # A single player that cannot be applied fails the request; a batch skips it
+            if not applied and 'players' not in player_data:
+                return False
 
-        # Handle single player
-        return _update_single_player(df, player_data, csv_file_path)
+        # Save updated dataframe once for the whole request
+        _dataset_cache['df'] = save_player_frame(df)
+        _dataset_cache['name_rows'] = name_rows
+        _dataset_cache['signature'] = player_dataset_signature()
+        return True
 
     except Exception as e:
-        logger.error(f"Error updating CSV data: {str(e)}")
+        logger.error(f"Error updating player data: {str(e)}")
         return False
 
 
-def _update_single_player(df, player_data, csv_file_path):
-    """Helper function to update a single player in the dataframe"""
-    try:
-        player_id = player_data.get('playerId')
-        player_name = player_data.get('name')
-        tournament_data = player_data.get('tournamentData', {})
+def _name_rows(df):
+    """Map each player name to the row positions holding it"""
+    name_rows = {}
+    for position, name in enumerate(df['Name'].to_numpy()):
+        name_rows.setdefault(name, []).append(position)
+    return name_rows
+
 
+def _apply_players(df, players, name_rows):
+    """Update existing players column by column and append new ones in a single concat; returns (df, players applied)
+
+    name_rows is the dataframe's name -> row positions map; appended players are added to it.
+    """
+    updates = {}  # Name -> stats for players already in the dataframe; the last update of a name wins
+    new_rows = {}  # Name -> row, so a player repeated in the batch is only added once
+    applied = 0
+
+    # Column -> position, built once per batch instead of looked up per player
+    column_positions = {column: df.columns.get_loc(column) for column in df.columns}
+
+    for player_data in players:
+        player_name = player_data.get('name')
         if not player_name:
             logger.warning("No player name provided, skipping update")
-            return False
-
-        # Extract data
-        total_runs = tournament_data.get('runs', 0)
-        balls_faced = tournament_data.get('ballsFaced', 0)
-        innings_played = tournament_data.get('inningsPlayed', 0)
-        wickets = tournament_data.get('wickets', 0)
-        overs_bowled = tournament_data.get('oversBowled', 0)
-        runs_conceded = tournament_data.get('runsConceded', 0)
-        category = player_data.get('category', '')
-        base_price = player_data.get('basePrice', 0)
-
-        # Determine if player exists in the dataframe
-        existing_player = df[df['Name'] == player_name]
-
-        if len(existing_player) > 0:
-            # Update existing player
-            df.loc[df['Name'] == player_name, 'Total Runs'] = total_runs
-            df.loc[df['Name'] == player_name, 'Balls Faced'] = balls_faced
-            df.loc[df['Name'] == player_name, 'Innings Played'] = innings_played
-            df.loc[df['Name'] == player_name, 'Wickets'] = wickets
-            df.loc[df['Name'] == player_name, 'Overs Bowled'] = overs_bowled
-            df.loc[df['Name'] == player_name, 'Runs Conceded'] = runs_conceded
-            df.loc[df['Name'] == player_name, 'Category'] = category
-            df.loc[df['Name'] == player_name, 'Base Price'] = base_price
-            logger.info(f"Updated player {player_name} in CSV")
+            continue
+
+        try:
+            stats = _extract_player_stats(player_data)
+        except Exception as e:
+            logger.error(f"Error updating single player: {str(e)}")
+            continue
+
+        if player_name in new_rows:
+            new_rows[player_name].update(stats)
+        elif player_name in name_rows:
+            updates[player_name] = stats
+            logger.info(f"Updated player {player_name} in the player dataset")
         else:
-            # Add new player
-            new_row = {
-                'Name': player_name,
-                'University': '',  # Default value
-                'Category': category,
-                'Total Runs': total_runs,
-                'Balls Faced': balls_faced,
-                'Innings Played': innings_played,
-                'Wickets': wickets,
-                'Overs Bowled': overs_bowled,
-                'Runs Conceded': runs_conceded,
-                'Base Price': base_price
-            }
-            df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-            logger.info(f"Added new player {player_name} to CSV")
-
-        # Save updated dataframe
-        df.to_csv(csv_file_path, index=False)
-        return True
+            new_rows[player_name] = _build_new_row(player_name, stats)
+            logger.info(f"Added new player {player_name} to the player dataset")
+        applied += 1
 
-    except Exception as e:
-        logger.error(f"Error updating single player in CSV: {str(e)}")
-        return False
+    if updates:
+        try:
+            _apply_updates_bulk(df, updates, name_rows, column_positions)
+        except (ValueError, TypeError) as e:
+            # A value that does not fit its column; apply player by player so only that player is skipped
+            logger.warning(f"Bulk player update failed, updating players one at a time: {str(e)}")
+            for player_name, stats in updates.items():
+                try:
+                    _apply_update_inplace(df, name_rows[player_name], column_positions, stats)
+                except Exception as e:
+                    logger.error(f"Error updating single player: {str(e)}")
+                    applied -= 1
+
+    if new_rows:
+        first_new_row = len(df)
+        df = pd.concat([df, pd.DataFrame(list(new_rows.values()), columns=list(_NEW_ROW_KEYS))], ignore_index=True)
+        for position, player_name in enumerate(new_rows, first_new_row):
+            name_rows[player_name] = [position]
+    return df, applied
+
+
+def _extract_player_stats(player_data):
+    """Map a player payload from the backend onto the CSV columns it updates"""
+    tournament_data = player_data.get('tournamentData', {})
+    return {
+        'Total Runs': tournament_data.get('runs', 0),
+        'Balls Faced': tournament_data.get('ballsFaced', 0),
+        'Innings Played': tournament_data.get('inningsPlayed', 0),
+        'Wickets': tournament_data.get('wickets', 0),
+        'Overs Bowled': tournament_data.get('oversBowled', 0),
+        'Runs Conceded': tournament_data.get('runsConceded', 0),
+        'Category': player_data.get('category', ''),
+        'Base Price': player_data.get('basePrice', 0)
+    }
+
+
+def _apply_updates_bulk(df, updates, name_rows, column_positions):
+    """Overwrite the stats of many existing players with one positional assignment per column
+
+    Every column's values are converted to the column's dtype before anything is written, so a
+    value that does not fit raises without leaving the dataframe partly updated.
+    """
+    rows = []
+    row_stats = []
+    for player_name, stats in updates.items():
+        for row in name_rows[player_name]:
+            rows.append(row)
+            row_stats.append(stats)
+
+    columns = {column: _column_values(df, column, [stats[column] for stats in row_stats])
+               for column in next(iter(updates.values()))}
+    _write_columns(df, rows, column_positions, columns)
+
+
+def _apply_update_inplace(df, rows, column_positions, stats):
+    """Overwrite an existing player's stats at the given row positions of the dataframe
+
+    All of the player's values are converted before any is written, so a value that does not fit
+    skips the whole player.
+    """
+    columns = {column: _column_values(df, column, [value] * len(rows)) for column, value in stats.items()}
+    _write_columns(df, rows, column_positions, columns)
+
+
+def _column_values(df, column, values):
+    """Convert values to a column's dtype without changing the dataframe; raises if one does not fit"""
+    dtype = df[column].dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        # Categorical columns only accept values among their categories; new values become new categories
+        new_categories = [value for value in dict.fromkeys(values) if value not in dtype.categories]
+        if new_categories:
+            dtype = pd.CategoricalDtype([*dtype.categories, *new_categories], ordered=dtype.ordered)
+    return pd.array(values, dtype=dtype)
 
 
-def search_player_by_name(players, name_query):
-    """Search for players by name"""
-    name_query = name_query.lower()
-    matched_players = []
+def _write_columns(df, rows, column_positions, columns):
+    """Write converted column values at the given row positions, one assignment per column"""
+    for column, values in columns.items():
+        if values.dtype != df[column].dtype:
+            # A categorical column gaining categories
+            df[column] = df[column].cat.set_categories(values.dtype.categories)
+        df.iloc[rows, column_positions[column]] = values
 
-    for player in players:
-        if name_query in player['name'].lower():
-            matched_players.append(player)
 
-    return matched_players
+def _build_new_row(player_name, stats):
+    """Build the CSV row for a player not yet in the dataframe"""
+    # University defaults to empty; every other column after Name comes from the stats
+    return dict(zip(_NEW_ROW_KEYS, (player_name, '', *map(stats.__getitem__, _NEW_ROW_KEYS[2:]))))
+
+
+def search_player_by_name(players, name_query, name_lowers=None):
+    """Search for players by name; name_lowers is the players' name_search_array if already built"""
+    if name_lowers is None:
+        name_lowers = name_search_array([player['name'] for player in players])
+
+    # Fold the query the way the names were folded
+    if name_lowers.dtype.kind == 'S':
+        # ASCII-only names, lowercased as bytes; a non-ASCII query cannot occur in any of them
+        name_query = name_query.lower()
+        if not name_query.isascii():
+            return []
+        name_query = name_query.encode('ascii')
+    else:
+        name_query = name_query.casefold()
+
+    # One vectorized substring search over every name
+    return [players[i] for i in np.flatnonzero(np.char.find(name_lowers, name_query) >= 0)]
 
 
 def format_player_info(player):
@@ -133,7 +265,7 @@ def format_player_info(player):
     University: {player['university']}
     Category: {player['category']}
     Role: {player['role']}
-    Base Price: ₹{int(player.get('base_price', 0)):,}
+    Base Price: {_base_price_str(player)}
     Stats:
       - Total Runs: {player['total_runs']}
       - Wickets: {player['wickets']}
@@ -145,10 +277,40 @@ def format_player_info(player):
     """
 
 
+def iter_player_list(players, description):
+    """Yield the heading and then one line per player, so callers can stop after the first few"""
+    yield f"\n{description}:\n\n"
+    # Don't include player points in the response
+    for i, player in enumerate(players, 1):
+        yield f"{i}. {player['name']} - {player['role']} - Base Price: {_base_price_str(player)} - Runs: {player['total_runs']}, Wickets: {player['wickets']}\n"
+
+
 def format_player_list(players, description):
     """Format a list of players into readable text"""
-    formatted_text = f"\n{description}:\n\n"
-    for i, player in enumerate(players, 1):
-        # Don't include player points in the response
-        formatted_text += f"{i}. {player['name']} - {player['role']} - Base Price: ₹{int(player.get('base_price', 0)):,} - Runs: {player['total_runs']}, Wickets: {player['wickets']}\n"
-    return formatted_text
\ No newline at end of file
+    return "".join(iter_player_list(players, description))
+
+
+def format_ranked_players(players, stat, show_role=False):
+    """Format players as numbered lines of name, base price and the given stat"""
+    if show_role:
+        return "".join(f"{i}. {player['name']} - {player['role']} - Base Price: {_base_price_str(player)} - {stat(player)}\n"
+                       for i, player in enumerate(players, 1))
+    return "".join(f"{i}. {player['name']} - Base Price: {_base_price_str(player)} - {stat(player)}\n"
+                   for i, player in enumerate(players, 1))
+
+
+def format_team(team):
+    """Format a team grouped into batsmen, bowlers and all-rounders; other roles are not listed"""
+    sections = {BATSMAN: [], BOWLER: [], ALL_ROUNDER: []}
+    stats = {BATSMAN: runs_stat, BOWLER: wickets_stat, ALL_ROUNDER: runs_and_wickets_stat}
+    for player in team:
+        role = role_lower(player['role'])
+        if role in sections:
+            sections[role].append(f"- {player['name']} (Base Price: {_base_price_str(player)}, {stats[role](player)})\n")
+
+    return "".join([
+        "Here's the best cricket team based on player value and role:\n\n",
+        "BATSMEN:\n", *sections[BATSMAN],
+        "\nBOWLERS:\n", *sections[BOWLER],
+        "\nALL-ROUNDERS:\n", *sections[ALL_ROUNDER]
+    ])